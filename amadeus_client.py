@@ -8,19 +8,29 @@ Amadeus Self-Service API (free tier):
   - Sign up: https://developers.amadeus.com
 """
 
+import asyncio
+import bisect
+import functools
 import httpx
 import os
 import random
 import logging
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from typing import Optional
 
+try:
+    # orjson parses large flight-offer payloads much faster than the stdlib
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
 logger = logging.getLogger(__name__)
 
 # One World alliance airline IATA codes
 ONEWORLD_AIRLINES = [
     "AA", "BA", "CX", "AY", "IB", "JL", "MH", "QF", "QR", "AT", "RJ", "UL", "AS", "FJ"
 ]
+ONEWORLD_AIRLINES_SET = frozenset(ONEWORLD_AIRLINES)
 
 # Which airlines typically fly which routes (realistic mapping)
 ROUTE_AIRLINE_MAP = {
@@ -96,6 +106,83 @@ AIRLINE_PRICE_MULTIPLIER = {
     "FJ": 0.92,
 }
 
+# Route data folded into a single lookup: (origin, destination) -> (airlines, base_price)
+ROUTE_INFO = {
+    route_key: (tuple(airlines), BASE_PRICES[route_key])
+    for route_key, airlines in ROUTE_AIRLINE_MAP.items()
+    if route_key in BASE_PRICES
+}
+
+# Dedicated generator for mock prices, independent of the global random state
+_RNG = random.Random()
+
+# Pre-joined includedAirlineCodes values for live searches
+ROUTE_INCLUDED_AIRLINES_STR = {
+    route_key: ",".join(airlines) for route_key, airlines in ROUTE_AIRLINE_MAP.items()
+}
+_DEFAULT_INCLUDED = ",".join(ONEWORLD_AIRLINES[:5])
+
+# Seasonal price factor indexed by month - 1 (summer, holidays and spring are pricier)
+_SEASONAL = (1.25, 1.0, 1.1, 1.1, 1.0, 1.3, 1.3, 1.3, 1.0, 1.0, 1.0, 1.25)
+
+# Urgency factor by days until departure: <7, <14, <30, <60, 60+
+_URGENCY_BOUNDS = (7, 14, 30, 60)
+_URGENCY_VALS = (1.5, 1.3, 1.15, 1.0, 0.9)
+
+
+@functools.lru_cache(maxsize=4096)
+def _route_factors(
+    origin: str,
+    destination: str,
+    departure_date: str,
+    cabin_class: str,
+    today_ordinal: int,
+) -> tuple:
+    """
+    Deterministic part of mock pricing for a route, date and cabin.
+
+    Returns (airlines, scales, multiplier) where multiplier combines the
+    seasonal, urgency and cabin factors and scales holds the pre-randomness
+    price for each airline (base price x airline multiplier x multiplier).
+    airlines and scales are None for routes we have no data for, so the
+    caller can pick random values.
+    ``today_ordinal`` keys the cache per day so the urgency factor stays current.
+    """
+    route_info = ROUTE_INFO.get((origin, destination))
+
+    # Parse departure date to add seasonal variation
+    try:
+        dep_date = date.fromisoformat(departure_date)
+        seasonal_factor = _SEASONAL[dep_date.month - 1]
+
+        # How far out the departure is - closer dates are pricier. Whole days from
+        # now until departure midnight, which is one less than the calendar gap
+        # at any time after 00:00:00
+        days_out = dep_date.toordinal() - today_ordinal - 1
+        urgency_factor = _URGENCY_VALS[bisect.bisect_right(_URGENCY_BOUNDS, days_out)]
+    except ValueError:
+        seasonal_factor = 1.0
+        urgency_factor = 1.0
+
+    # Cabin class multipliers
+    cabin_multiplier = {
+        "ECONOMY": 1.0,
+        "PREMIUM_ECONOMY": 1.6,
+        "BUSINESS": 3.2,
+        "FIRST": 5.5,
+    }.get(cabin_class, 1.0)
+
+    multiplier = seasonal_factor * urgency_factor * cabin_multiplier
+    if route_info is None:
+        return None, None, multiplier
+
+    airlines, base_price = route_info
+    scales = tuple(
+        base_price * AIRLINE_PRICE_MULTIPLIER.get(airline, 1.0) * multiplier
+        for airline in airlines
+    )
+    return airlines, scales, multiplier
+
 
 class AmadeusClient:
     """Client for Amadeus Self-Service API."""
@@ -103,27 +190,78 @@ class AmadeusClient:
     BASE_URL_TEST = "https://test.api.amadeus.com"
     BASE_URL_PROD = "https://api.amadeus.com"
 
+    # Access token is shared by every instance in the process
+    _access_token: Optional[str] = None
+    _token_expires_at: Optional[datetime] = None
+    _auth_lock = asyncio.Lock()
+
+    # IATA code -> display name for mock results
+    _AIRLINE_NAMES = {
+        "AA": "American Airlines",
+        "BA": "British Airways",
+        "CX": "Cathay Pacific",
+        "AY": "Finnair",
+        "IB": "Iberia",
+        "JL": "Japan Airlines",
+        "MH": "Malaysia Airlines",
+        "QF": "Qantas",
+        "QR": "Qatar Airways",
+        "AT": "Royal Air Maroc",
+        "RJ": "Royal Jordanian",
+        "UL": "SriLankan Airlines",
+        "AS": "Alaska Airlines",
+        "FJ": "Fiji Airways",
+    }
+
     def __init__(self):
         self.api_key = os.getenv("AMADEUS_API_KEY", "")
         self.api_secret = os.getenv("AMADEUS_API_SECRET", "")
         self.env = os.getenv("AMADEUS_ENV", "test")
         self.use_mock = os.getenv("USE_MOCK_DATA", "true").lower() == "true"
-        self.access_token = None
-        self.token_expires_at = None
+        self._client: Optional[httpx.AsyncClient] = None
 
         if self.env == "production":
             self.base_url = self.BASE_URL_PROD
         else:
             self.base_url = self.BASE_URL_TEST
 
+    async def _get_client(self) -> httpx.AsyncClient:
+        """Get the shared HTTP client, creating it on first use so connections are kept alive."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                http2=True,
+                timeout=30.0,
+                limits=httpx.Limits(max_keepalive_connections=20),
+            )
+        return self._client
+
+    async def aclose(self):
+        """Close the shared HTTP client."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @classmethod
+    def _token_valid(cls) -> bool:
+        """Check whether the shared access token is present and unexpired."""
+        return bool(
+            cls._access_token and cls._token_expires_at and datetime.utcnow() < cls._token_expires_at
+        )
+
     async def _authenticate(self):
         """Authenticate with Amadeus API and get access token."""
-        if self.access_token and self.token_expires_at and datetime.utcnow() < self.token_expires_at:
+        if self._token_valid():
             return
 
-        async with httpx.AsyncClient() as client:
+        async with self._auth_lock:
+            # Another coroutine may have refreshed the token while we waited
+            if self._token_valid():
+                return
+
+            client = await self._get_client()
             response = await client.post(
-                f"{self.base_url}/v1/security/oauth2/token",
+                "/v1/security/oauth2/token",
                 data={
                     "grant_type": "client_credentials",
                     "client_id": self.api_key,
@@ -133,9 +271,9 @@ class AmadeusClient:
             )
 
             if response.status_code == 200:
-                data = response.json()
-                self.access_token = data["access_token"]
-                self.token_expires_at = datetime.utcnow() + timedelta(
+                data = json_loads(response.content)
+                AmadeusClient._access_token = data["access_token"]
+                AmadeusClient._token_expires_at = datetime.utcnow() + timedelta(
                     seconds=data.get("expires_in", 1799) - 60
                 )
                 logger.info("Amadeus authentication successful")
@@ -196,37 +334,37 @@ class AmadeusClient:
                 params["returnDate"] = return_date
 
             # Filter for One World airlines
-            params["includedAirlineCodes"] = ",".join(
-                ROUTE_AIRLINE_MAP.get((origin, destination), ONEWORLD_AIRLINES[:5])
+            params["includedAirlineCodes"] = ROUTE_INCLUDED_AIRLINES_STR.get(
+                (origin, destination), _DEFAULT_INCLUDED
             )
 
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.base_url}/v2/shopping/flight-offers",
-                    params=params,
-                    headers={"Authorization": f"Bearer {self.access_token}"},
-                    timeout=30.0,
-                )
+            client = await self._get_client()
+            response = await client.get(
+                "/v2/shopping/flight-offers",
+                params=params,
+                headers={"Authorization": f"Bearer {self._access_token}"},
+                timeout=30.0,
+            )
 
-                if response.status_code == 200:
-                    data = response.json()
-                    results = self._parse_amadeus_response(data)
-                    if results:
-                        return results
-                    # Amadeus returned no results for this route — fall back to mock
-                    logger.info(
-                        f"Amadeus returned 0 results for {origin}-{destination}. Using mock data."
-                    )
-                    return self._generate_mock_data(
-                        origin, destination, departure_date, return_date, cabin_class
-                    )
-                else:
-                    logger.warning(
-                        f"Amadeus API error: {response.status_code}. Falling back to mock data."
-                    )
-                    return self._generate_mock_data(
-                        origin, destination, departure_date, return_date, cabin_class
-                    )
+            if response.status_code == 200:
+                data = json_loads(response.content)
+                results = self._parse_amadeus_response(data)
+                if results:
+                    return results
+                # Amadeus returned no results for this route — fall back to mock
+                logger.info(
+                    f"Amadeus returned 0 results for {origin}-{destination}. Using mock data."
+                )
+                return self._generate_mock_data(
+                    origin, destination, departure_date, return_date, cabin_class
+                )
+            else:
+                logger.warning(
+                    f"Amadeus API error: {response.status_code}. Falling back to mock data."
+                )
+                return self._generate_mock_data(
+                    origin, destination, departure_date, return_date, cabin_class
+                )
         except Exception as e:
             logger.warning(f"Amadeus API request failed: {e}. Falling back to mock data.")
             return self._generate_mock_data(
@@ -240,32 +378,32 @@ class AmadeusClient:
         carrier_dict = data.get("dictionaries", {}).get("carriers", {})
 
         for offer in offers:
-            price = float(offer.get("price", {}).get("total", 0))
-            currency = offer.get("price", {}).get("currency", "USD")
-
             # Get the operating airline from the first segment
-            segments = offer.get("itineraries", [{}])[0].get("segments", [])
-            if segments:
-                airline_code = segments[0].get("operating", {}).get(
-                    "carrierCode", segments[0].get("carrierCode", "")
-                )
-            else:
-                airline_code = ""
+            itineraries = offer.get("itineraries") or [{}]
+            segments = itineraries[0].get("segments", [])
+            if not segments:
+                continue
+            first_segment = segments[0]
+            airline_code = first_segment.get("operating", {}).get(
+                "carrierCode", first_segment.get("carrierCode", "")
+            )
 
             # Only include One World airlines
-            if airline_code in ONEWORLD_AIRLINES:
-                results.append({
-                    "airline_code": airline_code,
-                    "airline_name": carrier_dict.get(airline_code, airline_code),
-                    "price": price,
-                    "currency": currency,
-                    "cabin_class": offer.get("travelerPricings", [{}])[0]
-                        .get("fareDetailsBySegment", [{}])[0]
-                        .get("cabin", "ECONOMY"),
-                    "departure_date": segments[0].get("departure", {}).get("at", "")[:10]
-                        if segments else "",
-                    "source": "amadeus",
-                })
+            if airline_code not in ONEWORLD_AIRLINES_SET:
+                continue
+
+            price_info = offer.get("price", {})
+            traveler_pricings = offer.get("travelerPricings") or [{}]
+            fare_details = traveler_pricings[0].get("fareDetailsBySegment") or [{}]
+            results.append({
+                "airline_code": airline_code,
+                "airline_name": carrier_dict.get(airline_code, airline_code),
+                "price": float(price_info.get("total", 0)),
+                "currency": price_info.get("currency", "USD"),
+                "cabin_class": fare_details[0].get("cabin", "ECONOMY"),
+                "departure_date": first_segment.get("departure", {}).get("at", "")[:10],
+                "source": "amadeus",
+            })
 
         return results
 
@@ -278,95 +416,35 @@ class AmadeusClient:
         cabin_class: str = "ECONOMY",
     ) -> list:
         """Generate realistic mock flight price data."""
-        route_key = (origin, destination)
-        airlines = ROUTE_AIRLINE_MAP.get(route_key, random.sample(ONEWORLD_AIRLINES, 3))
-        base_price = BASE_PRICES.get(route_key, random.randint(200, 800))
-
-        results = []
-
-        # Parse departure date to add seasonal variation
-        try:
-            dep_date = datetime.strptime(departure_date, "%Y-%m-%d")
-            # Summer months (Jun-Aug) are more expensive
-            month = dep_date.month
-            if month in [6, 7, 8]:
-                seasonal_factor = 1.3
-            elif month in [12, 1]:  # Holiday season
-                seasonal_factor = 1.25
-            elif month in [3, 4]:  # Spring
-                seasonal_factor = 1.1
-            else:
-                seasonal_factor = 1.0
-
-            # How far out the departure is - closer dates are pricier
-            days_out = (dep_date - datetime.utcnow()).days
-            if days_out < 7:
-                urgency_factor = 1.5
-            elif days_out < 14:
-                urgency_factor = 1.3
-            elif days_out < 30:
-                urgency_factor = 1.15
-            elif days_out < 60:
-                urgency_factor = 1.0
-            else:
-                urgency_factor = 0.9
-        except ValueError:
-            seasonal_factor = 1.0
-            urgency_factor = 1.0
-
-        # Cabin class multipliers
-        cabin_multiplier = {
-            "ECONOMY": 1.0,
-            "PREMIUM_ECONOMY": 1.6,
-            "BUSINESS": 3.2,
-            "FIRST": 5.5,
-        }.get(cabin_class, 1.0)
-
-        for airline in airlines:
-            airline_mult = AIRLINE_PRICE_MULTIPLIER.get(airline, 1.0)
-
-            # Add some randomness to simulate real price variation
-            random_factor = random.uniform(0.88, 1.15)
-
-            price = round(
-                base_price
-                * airline_mult
-                * seasonal_factor
-                * urgency_factor
-                * cabin_multiplier
-                * random_factor,
-                2,
-            )
-
-            results.append({
+        airlines, scales, multiplier = _route_factors(
+            origin, destination, departure_date, cabin_class, datetime.utcnow().toordinal()
+        )
+        if airlines is None:
+            airlines = _RNG.sample(ONEWORLD_AIRLINES, 3)
+            base_price = _RNG.randint(200, 800)
+            scales = [
+                base_price * AIRLINE_PRICE_MULTIPLIER.get(airline, 1.0) * multiplier
+                for airline in airlines
+            ]
+
+        # Add some randomness to simulate real price variation
+        uniform = _RNG.uniform
+        results = [
+            {
                 "airline_code": airline,
                 "airline_name": self._get_airline_name(airline),
-                "price": price,
+                "price": round(scale * uniform(0.88, 1.15), 2),
                 "currency": "USD",
                 "cabin_class": cabin_class,
                 "departure_date": departure_date,
                 "source": "mock",
-            })
+            }
+            for airline, scale in zip(airlines, scales)
+        ]
 
         return sorted(results, key=lambda x: x["price"])
 
-    @staticmethod
-    def _get_airline_name(code: str) -> str:
+    @classmethod
+    def _get_airline_name(cls, code: str) -> str:
         """Get airline name from IATA code."""
-        names = {
-            "AA": "American Airlines",
-            "BA": "British Airways",
-            "CX": "Cathay Pacific",
-            "AY": "Finnair",
-            "IB": "Iberia",
-            "JL": "Japan Airlines",
-            "MH": "Malaysia Airlines",
-            "QF": "Qantas",
-            "QR": "Qatar Airways",
-            "AT": "Royal Air Maroc",
-            "RJ": "Royal Jordanian",
-            "UL": "SriLankan Airlines",
-            "AS": "Alaska Airlines",
-            "FJ": "Fiji Airways",
-        }
-        return names.get(code, code)
+        return cls._AIRLINE_NAMES.get(code, code)
@@ -0,0 +1,70 @@
+"""
+In-process TTL cache for async functions.
+Keeps slowly-changing lookups (dashboard stats, routes, airlines) out of the
+database between scheduled price fetches.
+"""
+
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+
+
+def ttl_cache(ttl: float, maxsize: int = 128, should_cache=None):
+    """
+    Cache an async function's results for ``ttl`` seconds, keyed on its arguments.
+
+    Concurrent misses for the same key share a single call. If ``should_cache``
+    is given, results for which it returns False are returned but not stored.
+    The wrapped function gains a ``cache_clear()`` method. Cached values are
+    shared between callers, so they must not be mutated.
+    """
+
+    def decorator(func):
+        entries = OrderedDict()  # key -> (expires_at, value)
+        locks = {}
+        generation = 0
+
+        def _lookup(key):
+            entry = entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry
+            return None
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            entry = _lookup(key)
+            if entry is not None:
+                return entry[1]
+
+            lock = locks.setdefault(key, asyncio.Lock())
+            async with lock:
+                # Another caller may have filled the entry while we waited
+                entry = _lookup(key)
+                if entry is not None:
+                    return entry[1]
+
+                started_in = generation
+                try:
+                    value = await func(*args, **kwargs)
+                finally:
+                    locks.pop(key, None)
+
+                # Don't store a result that was computed before a cache_clear()
+                if started_in == generation and (should_cache is None or should_cache(value)):
+                    entries[key] = (time.monotonic() + ttl, value)
+                    entries.move_to_end(key)
+                    while len(entries) > maxsize:
+                        entries.popitem(last=False)
+                return value
+
+        def cache_clear():
+            nonlocal generation
+            generation += 1
+            entries.clear()
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+
+    return decorator
@@ -0,0 +1,55 @@
+"""
+Shared API clients.
+A single AmadeusClient is reused by the scheduler and the API so connections
+and the access token are shared across the whole process, and recent search
+results are memoized so repeated queries don't spend Amadeus quota.
+Only interactive searches go through the cache; the scheduler calls
+amadeus_client directly so stored snapshots are always freshly fetched.
+"""
+
+from typing import Optional
+
+from amadeus_client import AmadeusClient
+from cache import ttl_cache
+
+amadeus_client = AmadeusClient()
+
+# Seconds a search result is reused
+SEARCH_CACHE_TTL = 900
+
+
+def _is_cacheable(offers: list) -> bool:
+    """Live mode falls back to mock offers on API errors; retry those next time."""
+    return amadeus_client.use_mock or not any(offer.get("source") == "mock" for offer in offers)
+
+
+@ttl_cache(SEARCH_CACHE_TTL, maxsize=1024, should_cache=_is_cacheable)
+async def _cached_search(
+    origin: str,
+    destination: str,
+    departure_date: str,
+    return_date: Optional[str],
+    cabin_class: str,
+) -> list:
+    return await amadeus_client.search_flights(
+        origin=origin,
+        destination=destination,
+        departure_date=departure_date,
+        return_date=return_date,
+        cabin_class=cabin_class,
+    )
+
+
+async def search_flights(
+    origin: str,
+    destination: str,
+    departure_date: str,
+    return_date: Optional[str] = None,
+    cabin_class: str = "ECONOMY",
+) -> list:
+    """
+    Search flight offers, reusing results from the last SEARCH_CACHE_TTL seconds.
+
+    The returned list is shared with other callers and must not be mutated.
+    """
+    return await _cached_search(origin, destination, departure_date, return_date, cabin_class)
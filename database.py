@@ -5,184 +5,306 @@ Stores airlines, routes, price snapshots, price history, and user alerts.
 """
 
 import aiosqlite
+import asyncio
 import os
 from datetime import datetime, timedelta
 from typing import Optional
 
+from cache import ttl_cache
+
 DB_PATH = os.path.join(os.path.dirname(__file__), "flight_monitor.db")
 
+# Seconds that read-mostly API lookups are served from memory
+CACHE_TTL = 60
+
+# Per-connection tuning: with WAL, NORMAL sync only fsyncs at checkpoints
+CONNECTION_PRAGMAS = """
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA mmap_size=268435456;
+    PRAGMA cache_size=-65536;
+"""
+
+
+def _dict_factory(cursor, row) -> dict:
+    """Build rows as plain dicts so results can be returned without conversion."""
+    return {col[0]: value for col, value in zip(cursor.description, row)}
+
+
+_db: Optional[aiosqlite.Connection] = None
+_db_lock = asyncio.Lock()
+
+# All coroutines share one connection and therefore one transaction, so every
+# write helper holds this from its first statement to its commit/rollback.
+# Otherwise one helper's commit or rollback would also apply to another's
+# pending statements.
+_write_lock = asyncio.Lock()
+
 
 async def get_db():
-    """Get a database connection."""
-    db = await aiosqlite.connect(DB_PATH)
-    db.row_factory = aiosqlite.Row
-    return db
+    """Get the shared database connection, opening it on first use."""
+    global _db
+    if _db is not None:
+        return _db
+
+    async with _db_lock:
+        if _db is None:
+            db = await aiosqlite.connect(DB_PATH)
+            db.row_factory = _dict_factory
+            await db.executescript(CONNECTION_PRAGMAS)
+            _db = db
+    return _db
+
+
+async def close_db():
+    """Close the shared database connection."""
+    global _db
+    if _db is not None:
+        await _db.close()
+        _db = None
+
+
+async def _count_rows(db: aiosqlite.Connection, table: str) -> int:
+    """Count the rows in a (trusted, hard-coded) table name."""
+    cursor = await db.execute(f"SELECT COUNT(*) AS count FROM {table}")
+    row = await cursor.fetchone()
+    return row["count"]
 
 
 async def init_db():
     """Initialize database tables and seed data."""
     db = await get_db()
-    try:
-        # Create tables
-        await db.executescript("""
-            CREATE TABLE IF NOT EXISTS airlines (
-                iata_code TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                alliance TEXT DEFAULT 'oneworld',
-                logo_url TEXT,
-                country TEXT
-            );
-
-            CREATE TABLE IF NOT EXISTS routes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                origin TEXT NOT NULL,
-                destination TEXT NOT NULL,
-                origin_city TEXT,
-                destination_city TEXT,
-                region TEXT,
-                UNIQUE(origin, destination)
-            );
-
-            CREATE TABLE IF NOT EXISTS price_snapshots (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                route_id INTEGER NOT NULL,
-                airline_code TEXT NOT NULL,
-                price REAL NOT NULL,
-                currency TEXT DEFAULT 'USD',
-                cabin_class TEXT DEFAULT 'ECONOMY',
-                departure_date TEXT,
-                return_date TEXT,
-                fetched_at TEXT NOT NULL DEFAULT (datetime('now')),
-                source TEXT DEFAULT 'amadeus',
-                FOREIGN KEY (route_id) REFERENCES routes(id),
-                FOREIGN KEY (airline_code) REFERENCES airlines(iata_code)
-            );
-
-            CREATE TABLE IF NOT EXISTS price_alerts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                route_id INTEGER NOT NULL,
-                airline_code TEXT,
-                target_price REAL NOT NULL,
-                email TEXT NOT NULL,
-                is_active INTEGER DEFAULT 1,
-                created_at TEXT NOT NULL DEFAULT (datetime('now')),
-                triggered_at TEXT,
-                FOREIGN KEY (route_id) REFERENCES routes(id)
-            );
-
-            CREATE INDEX IF NOT EXISTS idx_snapshots_route ON price_snapshots(route_id);
-            CREATE INDEX IF NOT EXISTS idx_snapshots_airline ON price_snapshots(airline_code);
-            CREATE INDEX IF NOT EXISTS idx_snapshots_fetched ON price_snapshots(fetched_at);
-            CREATE INDEX IF NOT EXISTS idx_snapshots_route_airline ON price_snapshots(route_id, airline_code);
+    # WAL is persistent in the database file, so setting it once is enough.
+    # Close the cursor: its pending result row would block the DROP INDEXes below
+    cursor = await db.execute("PRAGMA journal_mode=WAL")
+    await cursor.close()
+
+    # Create tables
+    await db.executescript("""
+        CREATE TABLE IF NOT EXISTS airlines (
+            iata_code TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            alliance TEXT DEFAULT 'oneworld',
+            logo_url TEXT,
+            country TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS routes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            origin TEXT NOT NULL,
+            destination TEXT NOT NULL,
+            origin_city TEXT,
+            destination_city TEXT,
+            region TEXT,
+            UNIQUE(origin, destination)
+        );
+
+        CREATE TABLE IF NOT EXISTS price_snapshots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            route_id INTEGER NOT NULL,
+            airline_code TEXT NOT NULL,
+            price REAL NOT NULL,
+            currency TEXT DEFAULT 'USD',
+            cabin_class TEXT DEFAULT 'ECONOMY',
+            departure_date TEXT,
+            return_date TEXT,
+            fetched_at TEXT NOT NULL DEFAULT (datetime('now')),
+            source TEXT DEFAULT 'amadeus',
+            FOREIGN KEY (route_id) REFERENCES routes(id),
+            FOREIGN KEY (airline_code) REFERENCES airlines(iata_code)
+        );
+
+        CREATE TABLE IF NOT EXISTS price_alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            route_id INTEGER NOT NULL,
+            airline_code TEXT,
+            target_price REAL NOT NULL,
+            email TEXT NOT NULL,
+            is_active INTEGER DEFAULT 1,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            triggered_at TEXT,
+            FOREIGN KEY (route_id) REFERENCES routes(id)
+        );
+
+        -- Most recent snapshot per route+airline, kept current by the trigger below
+        CREATE TABLE IF NOT EXISTS latest_snapshots (
+            route_id INTEGER NOT NULL,
+            airline_code TEXT NOT NULL,
+            snapshot_id INTEGER NOT NULL,
+            price REAL NOT NULL,
+            currency TEXT,
+            cabin_class TEXT,
+            departure_date TEXT,
+            return_date TEXT,
+            fetched_at TEXT NOT NULL,
+            source TEXT,
+            PRIMARY KEY (route_id, airline_code),
+            FOREIGN KEY (route_id) REFERENCES routes(id),
+            FOREIGN KEY (airline_code) REFERENCES airlines(iata_code)
+        );
+
+        CREATE TRIGGER IF NOT EXISTS trg_snapshots_latest
+        AFTER INSERT ON price_snapshots
+        BEGIN
+            INSERT INTO latest_snapshots
+                (route_id, airline_code, snapshot_id, price, currency, cabin_class,
+                 departure_date, return_date, fetched_at, source)
+            VALUES
+                (NEW.route_id, NEW.airline_code, NEW.id, NEW.price, NEW.currency, NEW.cabin_class,
+                 NEW.departure_date, NEW.return_date, NEW.fetched_at, NEW.source)
+            ON CONFLICT (route_id, airline_code) DO UPDATE SET
+                snapshot_id = excluded.snapshot_id,
+                price = excluded.price,
+                currency = excluded.currency,
+                cabin_class = excluded.cabin_class,
+                departure_date = excluded.departure_date,
+                return_date = excluded.return_date,
+                fetched_at = excluded.fetched_at,
+                source = excluded.source;
+        END;
+
+        CREATE INDEX IF NOT EXISTS idx_snapshots_airline ON price_snapshots(airline_code);
+        CREATE INDEX IF NOT EXISTS idx_snapshots_fetched ON price_snapshots(fetched_at);
+        CREATE INDEX IF NOT EXISTS idx_snap_route_fetched ON price_snapshots(route_id, fetched_at);
+        -- Superseded: route_id is a prefix of idx_snap_route_fetched, and latest
+        -- prices are read from latest_snapshots rather than price_snapshots
+        DROP INDEX IF EXISTS idx_snapshots_route;
+        DROP INDEX IF EXISTS idx_snapshots_route_airline;
+        DROP INDEX IF EXISTS idx_latest;
+    """)
+
+    # Backfill latest_snapshots for databases created before it existed
+    cursor = await db.execute("SELECT EXISTS (SELECT 1 FROM latest_snapshots) AS populated")
+    row = await cursor.fetchone()
+    if not row["populated"]:
+        await db.execute("""
+            INSERT INTO latest_snapshots
+                (route_id, airline_code, snapshot_id, price, currency, cabin_class,
+                 departure_date, return_date, fetched_at, source)
+            SELECT route_id, airline_code, id, price, currency, cabin_class,
+                   departure_date, return_date, fetched_at, source
+            FROM price_snapshots
+            WHERE id IN (SELECT MAX(id) FROM price_snapshots GROUP BY route_id, airline_code)
         """)
 
-        # Seed One World alliance airlines
-        oneworld_airlines = [
-            ("AA", "American Airlines", "oneworld", "United States"),
-            ("BA", "British Airways", "oneworld", "United Kingdom"),
-            ("CX", "Cathay Pacific", "oneworld", "Hong Kong"),
-            ("AY", "Finnair", "oneworld", "Finland"),
-            ("IB", "Iberia", "oneworld", "Spain"),
-            ("JL", "Japan Airlines", "oneworld", "Japan"),
-            ("MH", "Malaysia Airlines", "oneworld", "Malaysia"),
-            ("QF", "Qantas", "oneworld", "Australia"),
-            ("QR", "Qatar Airways", "oneworld", "Qatar"),
-            ("AT", "Royal Air Maroc", "oneworld", "Morocco"),
-            ("RJ", "Royal Jordanian", "oneworld", "Jordan"),
-            ("UL", "SriLankan Airlines", "oneworld", "Sri Lanka"),
-            ("AS", "Alaska Airlines", "oneworld", "United States"),
-            ("FJ", "Fiji Airways", "oneworld", "Fiji"),
-        ]
-
-        for code, name, alliance, country in oneworld_airlines:
-            await db.execute(
-                """INSERT OR IGNORE INTO airlines (iata_code, name, alliance, country)
-                   VALUES (?, ?, ?, ?)""",
-                (code, name, alliance, country),
-            )
+    # Seed One World alliance airlines
+    oneworld_airlines = [
+        ("AA", "American Airlines", "oneworld", "United States"),
+        ("BA", "British Airways", "oneworld", "United Kingdom"),
+        ("CX", "Cathay Pacific", "oneworld", "Hong Kong"),
+        ("AY", "Finnair", "oneworld", "Finland"),
+        ("IB", "Iberia", "oneworld", "Spain"),
+        ("JL", "Japan Airlines", "oneworld", "Japan"),
+        ("MH", "Malaysia Airlines", "oneworld", "Malaysia"),
+        ("QF", "Qantas", "oneworld", "Australia"),
+        ("QR", "Qatar Airways", "oneworld", "Qatar"),
+        ("AT", "Royal Air Maroc", "oneworld", "Morocco"),
+        ("RJ", "Royal Jordanian", "oneworld", "Jordan"),
+        ("UL", "SriLankan Airlines", "oneworld", "Sri Lanka"),
+        ("AS", "Alaska Airlines", "oneworld", "United States"),
+        ("FJ", "Fiji Airways", "oneworld", "Fiji"),
+    ]
+
+    if await _count_rows(db, "airlines") < len(oneworld_airlines):
+        await db.executemany(
+            """INSERT OR IGNORE INTO airlines (iata_code, name, alliance, country)
+               VALUES (?, ?, ?, ?)""",
+            oneworld_airlines,
+        )
 
-        # Seed major global routes
-        global_routes = [
-            ("LHR", "JFK", "London Heathrow", "New York JFK", "Transatlantic"),
-            ("JFK", "LHR", "New York JFK", "London Heathrow", "Transatlantic"),
-            ("LAX", "NRT", "Los Angeles", "Tokyo Narita", "Transpacific"),
-            ("NRT", "LAX", "Tokyo Narita", "Los Angeles", "Transpacific"),
-            ("SYD", "SIN", "Sydney", "Singapore", "Asia-Pacific"),
-            ("SIN", "SYD", "Singapore", "Sydney", "Asia-Pacific"),
-            ("LHR", "HKG", "London Heathrow", "Hong Kong", "Europe-Asia"),
-            ("HKG", "LHR", "Hong Kong", "London Heathrow", "Europe-Asia"),
-            ("DOH", "LHR", "Doha", "London Heathrow", "Middle East-Europe"),
-            ("LHR", "DOH", "London Heathrow", "Doha", "Middle East-Europe"),
-            ("JFK", "LAX", "New York JFK", "Los Angeles", "US Domestic"),
-            ("LAX", "JFK", "Los Angeles", "New York JFK", "US Domestic"),
-            ("MAD", "JFK", "Madrid", "New York JFK", "Transatlantic"),
-            ("JFK", "MAD", "New York JFK", "Madrid", "Transatlantic"),
-            ("HEL", "NRT", "Helsinki", "Tokyo Narita", "Europe-Asia"),
-            ("NRT", "HEL", "Tokyo Narita", "Helsinki", "Europe-Asia"),
-            ("SYD", "LAX", "Sydney", "Los Angeles", "Transpacific"),
-            ("LAX", "SYD", "Los Angeles", "Sydney", "Transpacific"),
-            ("LHR", "SYD", "London Heathrow", "Sydney", "Europe-Oceania"),
-            ("SYD", "LHR", "Sydney", "London Heathrow", "Europe-Oceania"),
-            ("AMM", "LHR", "Amman", "London Heathrow", "Middle East-Europe"),
-            ("KUL", "NRT", "Kuala Lumpur", "Tokyo Narita", "Asia"),
-            ("CMB", "SIN", "Colombo", "Singapore", "Asia"),
-            ("CMN", "JFK", "Casablanca", "New York JFK", "Africa-Americas"),
-        ]
-
-        for origin, dest, o_city, d_city, region in global_routes:
-            await db.execute(
-                """INSERT OR IGNORE INTO routes (origin, destination, origin_city, destination_city, region)
-                   VALUES (?, ?, ?, ?, ?)""",
-                (origin, dest, o_city, d_city, region),
-            )
+    # Seed major global routes
+    global_routes = [
+        ("LHR", "JFK", "London Heathrow", "New York JFK", "Transatlantic"),
+        ("JFK", "LHR", "New York JFK", "London Heathrow", "Transatlantic"),
+        ("LAX", "NRT", "Los Angeles", "Tokyo Narita", "Transpacific"),
+        ("NRT", "LAX", "Tokyo Narita", "Los Angeles", "Transpacific"),
+        ("SYD", "SIN", "Sydney", "Singapore", "Asia-Pacific"),
+        ("SIN", "SYD", "Singapore", "Sydney", "Asia-Pacific"),
+        ("LHR", "HKG", "London Heathrow", "Hong Kong", "Europe-Asia"),
+        ("HKG", "LHR", "Hong Kong", "London Heathrow", "Europe-Asia"),
+        ("DOH", "LHR", "Doha", "London Heathrow", "Middle East-Europe"),
+        ("LHR", "DOH", "London Heathrow", "Doha", "Middle East-Europe"),
+        ("JFK", "LAX", "New York JFK", "Los Angeles", "US Domestic"),
+        ("LAX", "JFK", "Los Angeles", "New York JFK", "US Domestic"),
+        ("MAD", "JFK", "Madrid", "New York JFK", "Transatlantic"),
+        ("JFK", "MAD", "New York JFK", "Madrid", "Transatlantic"),
+        ("HEL", "NRT", "Helsinki", "Tokyo Narita", "Europe-Asia"),
+        ("NRT", "HEL", "Tokyo Narita", "Helsinki", "Europe-Asia"),
+        ("SYD", "LAX", "Sydney", "Los Angeles", "Transpacific"),
+        ("LAX", "SYD", "Los Angeles", "Sydney", "Transpacific"),
+        ("LHR", "SYD", "London Heathrow", "Sydney", "Europe-Oceania"),
+        ("SYD", "LHR", "Sydney", "London Heathrow", "Europe-Oceania"),
+        ("AMM", "LHR", "Amman", "London Heathrow", "Middle East-Europe"),
+        ("KUL", "NRT", "Kuala Lumpur", "Tokyo Narita", "Asia"),
+        ("CMB", "SIN", "Colombo", "Singapore", "Asia"),
+        ("CMN", "JFK", "Casablanca", "New York JFK", "Africa-Americas"),
+    ]
+
+    if await _count_rows(db, "routes") < len(global_routes):
+        await db.executemany(
+            """INSERT OR IGNORE INTO routes (origin, destination, origin_city, destination_city, region)
+               VALUES (?, ?, ?, ?, ?)""",
+            global_routes,
+        )
 
-        await db.commit()
-    finally:
-        await db.close()
+    await db.commit()
 
 
 # ── Query functions ──────────────────────────────────────────────────────────
 
 
+def invalidate_cache():
+    """Drop cached query results after prices or alerts change."""
+    for func in (get_airlines, get_routes, get_route_regions, get_dashboard_stats):
+        func.cache_clear()
+
+
+@ttl_cache(CACHE_TTL)
 async def get_airlines():
     """Get all One World alliance airlines."""
     db = await get_db()
-    try:
-        cursor = await db.execute(
-            "SELECT * FROM airlines WHERE alliance = 'oneworld' ORDER BY name"
-        )
-        rows = await cursor.fetchall()
-        return [dict(row) for row in rows]
-    finally:
-        await db.close()
+    cursor = await db.execute(
+        "SELECT * FROM airlines WHERE alliance = 'oneworld' ORDER BY name"
+    )
+    return await cursor.fetchall()
 
 
+@ttl_cache(CACHE_TTL)
 async def get_routes(region: Optional[str] = None):
     """Get monitored routes, optionally filtered by region."""
     db = await get_db()
-    try:
-        if region:
-            cursor = await db.execute(
-                "SELECT * FROM routes WHERE region = ? ORDER BY origin_city",
-                (region,),
-            )
-        else:
-            cursor = await db.execute("SELECT * FROM routes ORDER BY region, origin_city")
-        rows = await cursor.fetchall()
-        return [dict(row) for row in rows]
-    finally:
-        await db.close()
+    if region:
+        cursor = await db.execute(
+            "SELECT * FROM routes WHERE region = ? ORDER BY origin_city",
+            (region,),
+        )
+    else:
+        cursor = await db.execute("SELECT * FROM routes ORDER BY region, origin_city")
+    return await cursor.fetchall()
+
+
+async def get_route_pairs() -> list:
+    """Get (id, origin, destination) for every monitored route."""
+    db = await get_db()
+    cursor = await db.execute("SELECT id, origin, destination FROM routes ORDER BY region, origin_city")
+    rows = await cursor.fetchall()
+    return [(row["id"], row["origin"], row["destination"]) for row in rows]
+
+
+async def get_route_by_id(route_id: int) -> Optional[dict]:
+    """Get a single route by its id, or None if it doesn't exist."""
+    db = await get_db()
+    cursor = await db.execute("SELECT * FROM routes WHERE id = ?", (route_id,))
+    return await cursor.fetchone()
 
 
+@ttl_cache(CACHE_TTL)
 async def get_route_regions():
     """Get distinct route regions."""
     db = await get_db()
-    try:
-        cursor = await db.execute("SELECT DISTINCT region FROM routes ORDER BY region")
-        rows = await cursor.fetchall()
-        return [row["region"] for row in rows]
-    finally:
-        await db.close()
+    cursor = await db.execute("SELECT DISTINCT region FROM routes ORDER BY region")
+    rows = await cursor.fetchall()
+    return [row["region"] for row in rows]
 
 
 async def save_price_snapshot(
@@ -197,7 +319,7 @@ async def save_price_snapshot(
 ):
     """Save a new price snapshot."""
     db = await get_db()
-    try:
+    async with _write_lock:
         await db.execute(
             """INSERT INTO price_snapshots
                (route_id, airline_code, price, currency, cabin_class,
@@ -207,45 +329,81 @@ async def save_price_snapshot(
              departure_date, return_date, source),
         )
         await db.commit()
-    finally:
-        await db.close()
 
 
-async def get_latest_prices(route_id: Optional[int] = None, airline_code: Optional[str] = None):
-    """Get the most recent price for each route+airline combination."""
+async def save_price_snapshots_bulk(rows: list):
+    """
+    Save many price snapshots in a single transaction.
+
+    Each row is a tuple of (route_id, airline_code, price, currency,
+    cabin_class, departure_date, return_date, source).
+    """
+    if not rows:
+        return
     db = await get_db()
-    try:
-        query = """
-            SELECT ps.*, r.origin, r.destination, r.origin_city, r.destination_city,
-                   r.region, a.name as airline_name
-            FROM price_snapshots ps
-            JOIN routes r ON ps.route_id = r.id
-            JOIN airlines a ON ps.airline_code = a.iata_code
-            WHERE ps.id IN (
-                SELECT MAX(id) FROM price_snapshots
-                GROUP BY route_id, airline_code
+    async with _write_lock:
+        try:
+            await db.executemany(
+                """INSERT INTO price_snapshots
+                   (route_id, airline_code, price, currency, cabin_class,
+                    departure_date, return_date, source)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                rows,
             )
-        """
-        params = []
-        conditions = []
+            await db.commit()
+        except Exception:
+            # Don't leave a half-written batch for the next commit on the shared connection
+            await db.rollback()
+            raise
 
-        if route_id:
-            conditions.append("ps.route_id = ?")
-            params.append(route_id)
-        if airline_code:
-            conditions.append("ps.airline_code = ?")
-            params.append(airline_code)
 
-        if conditions:
-            query += " AND " + " AND ".join(conditions)
-
-        query += " ORDER BY ps.price ASC"
+async def get_latest_prices(route_id: Optional[int] = None, airline_code: Optional[str] = None):
+    """Get the most recent price for each route+airline combination."""
+    db = await get_db()
+    query = """
+        SELECT ls.snapshot_id as id, ls.route_id, ls.airline_code, ls.price, ls.currency,
+               ls.cabin_class, ls.departure_date, ls.return_date, ls.fetched_at, ls.source,
+               r.origin, r.destination, r.origin_city, r.destination_city,
+               r.region, a.name as airline_name
+        FROM latest_snapshots ls
+        JOIN routes r ON ls.route_id = r.id
+        JOIN airlines a ON ls.airline_code = a.iata_code
+    """
+    params = []
+    conditions = []
+
+    # Filters hit the (route_id, airline_code) primary key of latest_snapshots
+    if route_id is not None:
+        conditions.append("ls.route_id = ?")
+        params.append(route_id)
+    if airline_code:
+        conditions.append("ls.airline_code = ?")
+        params.append(airline_code)
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    query += " ORDER BY ls.price ASC"
+
+    cursor = await db.execute(query, params)
+    return await cursor.fetchall()
+
+
+_HISTORY_SQL_ALL = """
+    SELECT ps.*, a.name as airline_name
+    FROM price_snapshots ps
+    JOIN airlines a ON ps.airline_code = a.iata_code
+    WHERE ps.route_id = ? AND ps.fetched_at >= ?
+    ORDER BY ps.fetched_at ASC
+"""
 
-        cursor = await db.execute(query, params)
-        rows = await cursor.fetchall()
-        return [dict(row) for row in rows]
-    finally:
-        await db.close()
+_HISTORY_SQL_BY_AIRLINE = """
+    SELECT ps.*, a.name as airline_name
+    FROM price_snapshots ps
+    JOIN airlines a ON ps.airline_code = a.iata_code
+    WHERE ps.route_id = ? AND ps.fetched_at >= ? AND ps.airline_code = ?
+    ORDER BY ps.fetched_at ASC
+"""
 
 
 async def get_price_history(
@@ -255,178 +413,181 @@ async def get_price_history(
 ):
     """Get price history for a route over the specified number of days."""
     db = await get_db()
-    try:
-        cutoff = (datetime.utcnow() - timedelta(days=days)).isoformat()
-        query = """
-            SELECT ps.*, a.name as airline_name
-            FROM price_snapshots ps
-            JOIN airlines a ON ps.airline_code = a.iata_code
-            WHERE ps.route_id = ? AND ps.fetched_at >= ?
-        """
-        params = [route_id, cutoff]
+    cursor = await db.execute(*_history_query(route_id, airline_code, days))
+    return await cursor.fetchall()
+
+
+async def iter_price_history(
+    route_id: int,
+    airline_code: Optional[str] = None,
+    days: int = 30,
+):
+    """Yield price history rows one at a time instead of loading them all."""
+    db = await get_db()
+    async with db.execute(*_history_query(route_id, airline_code, days)) as cursor:
+        async for row in cursor:
+            yield row
 
-        if airline_code:
-            query += " AND ps.airline_code = ?"
-            params.append(airline_code)
 
-        query += " ORDER BY ps.fetched_at ASC"
+def _history_cutoff(days: int) -> str:
+    """Earliest fetched_at included in a ``days``-long history window."""
+    # Same layout as SQLite's datetime('now') so string comparison is exact
+    return (datetime.utcnow() - timedelta(days=days)).isoformat(sep=" ", timespec="seconds")
 
-        cursor = await db.execute(query, params)
-        rows = await cursor.fetchall()
-        return [dict(row) for row in rows]
-    finally:
-        await db.close()
+
+def _history_query(route_id: int, airline_code: Optional[str], days: int):
+    cutoff = _history_cutoff(days)
+    if airline_code:
+        return _HISTORY_SQL_BY_AIRLINE, (route_id, cutoff, airline_code)
+    return _HISTORY_SQL_ALL, (route_id, cutoff)
 
 
 async def get_price_comparison(route_id: int):
     """Compare latest prices across airlines for a specific route."""
     db = await get_db()
-    try:
-        cursor = await db.execute(
-            """
-            SELECT ps.airline_code, a.name as airline_name, ps.price, ps.currency,
-                   ps.cabin_class, ps.fetched_at, ps.departure_date,
-                   r.origin, r.destination, r.origin_city, r.destination_city
-            FROM price_snapshots ps
-            JOIN airlines a ON ps.airline_code = a.iata_code
-            JOIN routes r ON ps.route_id = r.id
-            WHERE ps.route_id = ? AND ps.id IN (
-                SELECT MAX(id) FROM price_snapshots
-                WHERE route_id = ?
-                GROUP BY airline_code
-            )
-            ORDER BY ps.price ASC
-            """,
-            (route_id, route_id),
-        )
-        rows = await cursor.fetchall()
-        return [dict(row) for row in rows]
-    finally:
-        await db.close()
+    cursor = await db.execute(
+        """
+        SELECT ls.airline_code, a.name as airline_name, ls.price, ls.currency,
+               ls.cabin_class, ls.fetched_at, ls.departure_date,
+               r.origin, r.destination, r.origin_city, r.destination_city
+        FROM latest_snapshots ls
+        JOIN airlines a ON ls.airline_code = a.iata_code
+        JOIN routes r ON ls.route_id = r.id
+        WHERE ls.route_id = ?
+        ORDER BY ls.price ASC
+        """,
+        (route_id,),
+    )
+    return await cursor.fetchall()
+
+
+_OVERVIEW_SQL = """
+    SELECT ps.*, a.name as airline_name,
+           r.origin, r.destination, r.origin_city, r.destination_city,
+           ps.fetched_at >= ? AS in_window,
+           ls.snapshot_id IS NOT NULL AS is_latest
+    FROM price_snapshots ps
+    JOIN airlines a ON ps.airline_code = a.iata_code
+    JOIN routes r ON ps.route_id = r.id
+    LEFT JOIN latest_snapshots ls
+        ON ls.route_id = ps.route_id AND ls.airline_code = ps.airline_code
+       AND ls.snapshot_id = ps.id
+    WHERE ps.route_id = ?
+      AND (ps.fetched_at >= ?
+           OR ps.id IN (SELECT snapshot_id FROM latest_snapshots WHERE route_id = ?))
+    ORDER BY ps.fetched_at ASC
+"""
+
+_HISTORY_KEYS = (
+    "id", "route_id", "airline_code", "price", "currency", "cabin_class",
+    "departure_date", "return_date", "fetched_at", "source", "airline_name",
+)
+_COMPARISON_KEYS = (
+    "airline_code", "airline_name", "price", "currency", "cabin_class", "fetched_at",
+    "departure_date", "origin", "destination", "origin_city", "destination_city",
+)
+
+
+async def get_route_overview(route_id: int, days: int = 30):
+    """Get price history and the latest per-airline comparison for a route in one query."""
+    db = await get_db()
+    cutoff = _history_cutoff(days)
+    cursor = await db.execute(_OVERVIEW_SQL, (cutoff, route_id, cutoff, route_id))
+
+    history, comparison = [], []
+    async for row in cursor:
+        if row["in_window"]:
+            history.append({k: row[k] for k in _HISTORY_KEYS})
+        if row["is_latest"]:
+            comparison.append({k: row[k] for k in _COMPARISON_KEYS})
+    comparison.sort(key=lambda c: c["price"])
+    return {"history": history, "comparison": comparison}
 
 
 async def create_alert(route_id: int, target_price: float, email: str, airline_code: str = None):
     """Create a new price alert."""
     db = await get_db()
-    try:
+    async with _write_lock:
         await db.execute(
             """INSERT INTO price_alerts (route_id, airline_code, target_price, email)
                VALUES (?, ?, ?, ?)""",
             (route_id, airline_code, target_price, email),
         )
         await db.commit()
-    finally:
-        await db.close()
 
 
 async def get_active_alerts():
     """Get all active price alerts."""
     db = await get_db()
-    try:
-        cursor = await db.execute(
-            """
-            SELECT pa.*, r.origin, r.destination, r.origin_city, r.destination_city
-            FROM price_alerts pa
-            JOIN routes r ON pa.route_id = r.id
-            WHERE pa.is_active = 1
-            ORDER BY pa.created_at DESC
-            """
-        )
-        rows = await cursor.fetchall()
-        return [dict(row) for row in rows]
-    finally:
-        await db.close()
+    cursor = await db.execute(
+        """
+        SELECT pa.*, r.origin, r.destination, r.origin_city, r.destination_city
+        FROM price_alerts pa
+        JOIN routes r ON pa.route_id = r.id
+        WHERE pa.is_active = 1
+        ORDER BY pa.created_at DESC
+        """
+    )
+    return await cursor.fetchall()
 
 
 async def check_and_trigger_alerts():
     """Check if any price alerts should be triggered."""
     db = await get_db()
-    triggered = []
-    try:
-        alerts = await get_active_alerts()
-        for alert in alerts:
-            # Get latest price for this route
-            query = """
-                SELECT MIN(ps.price) as lowest_price, ps.airline_code
-                FROM price_snapshots ps
-                WHERE ps.route_id = ? AND ps.id IN (
-                    SELECT MAX(id) FROM price_snapshots
-                    WHERE route_id = ?
-                    GROUP BY airline_code
-                )
-            """
-            params = [alert["route_id"], alert["route_id"]]
-
-            if alert.get("airline_code"):
-                query += " AND ps.airline_code = ?"
-                params.append(alert["airline_code"])
-
-            cursor = await db.execute(query, params)
-            row = await cursor.fetchone()
-
-            if row and row["lowest_price"] and row["lowest_price"] <= alert["target_price"]:
-                # Trigger the alert
-                await db.execute(
-                    "UPDATE price_alerts SET triggered_at = datetime('now') WHERE id = ?",
-                    (alert["id"],),
-                )
-                triggered.append({
-                    **alert,
-                    "current_price": row["lowest_price"],
-                })
-
-        await db.commit()
-        return triggered
-    finally:
-        await db.close()
+    # Lowest current price per active alert, restricted to its airline when set
+    cursor = await db.execute(
+        """
+        SELECT pa.*, r.origin, r.destination, r.origin_city, r.destination_city,
+               MIN(ls.price) as current_price
+        FROM price_alerts pa
+        JOIN routes r ON pa.route_id = r.id
+        JOIN latest_snapshots ls
+          ON ls.route_id = pa.route_id
+         AND (COALESCE(pa.airline_code, '') = '' OR ls.airline_code = pa.airline_code)
+        WHERE pa.is_active = 1
+        GROUP BY pa.id
+        HAVING MIN(ls.price) <= pa.target_price
+        ORDER BY pa.created_at DESC
+        """
+    )
+    triggered = await cursor.fetchall()
+
+    if triggered:
+        async with _write_lock:
+            await db.executemany(
+                "UPDATE price_alerts SET triggered_at = datetime('now') WHERE id = ?",
+                [(alert["id"],) for alert in triggered],
+            )
+            await db.commit()
+    return triggered
 
 
+@ttl_cache(CACHE_TTL)
 async def get_dashboard_stats():
     """Get summary statistics for the dashboard."""
     db = await get_db()
-    try:
-        stats = {}
-
-        # Total routes monitored
-        cursor = await db.execute("SELECT COUNT(*) as count FROM routes")
-        row = await cursor.fetchone()
-        stats["total_routes"] = row["count"]
-
-        # Total airlines
-        cursor = await db.execute("SELECT COUNT(*) as count FROM airlines")
-        row = await cursor.fetchone()
-        stats["total_airlines"] = row["count"]
-
-        # Total price snapshots
-        cursor = await db.execute("SELECT COUNT(*) as count FROM price_snapshots")
-        row = await cursor.fetchone()
-        stats["total_snapshots"] = row["count"]
-
-        # Active alerts
-        cursor = await db.execute("SELECT COUNT(*) as count FROM price_alerts WHERE is_active = 1")
-        row = await cursor.fetchone()
-        stats["active_alerts"] = row["count"]
-
-        # Last update time
-        cursor = await db.execute("SELECT MAX(fetched_at) as last_update FROM price_snapshots")
-        row = await cursor.fetchone()
-        stats["last_update"] = row["last_update"]
-
-        # Cheapest current flight
-        cursor = await db.execute("""
-            SELECT ps.price, ps.currency, ps.airline_code, a.name as airline_name,
-                   r.origin_city, r.destination_city
-            FROM price_snapshots ps
-            JOIN airlines a ON ps.airline_code = a.iata_code
-            JOIN routes r ON ps.route_id = r.id
-            WHERE ps.id IN (SELECT MAX(id) FROM price_snapshots GROUP BY route_id, airline_code)
-            ORDER BY ps.price ASC
-            LIMIT 1
-        """)
-        row = await cursor.fetchone()
-        if row:
-            stats["cheapest_flight"] = dict(row)
-
-        return stats
-    finally:
-        await db.close()
+    cursor = await db.execute("""
+        SELECT
+            (SELECT COUNT(*) FROM routes) AS total_routes,
+            (SELECT COUNT(*) FROM airlines) AS total_airlines,
+            (SELECT COUNT(*) FROM price_snapshots) AS total_snapshots,
+            (SELECT COUNT(*) FROM price_alerts WHERE is_active = 1) AS active_alerts,
+            (SELECT MAX(fetched_at) FROM price_snapshots) AS last_update
+    """)
+    stats = await cursor.fetchone()
+
+    # Cheapest current flight
+    cursor = await db.execute("""
+        SELECT ls.price, ls.currency, ls.airline_code, a.name as airline_name,
+               r.origin_city, r.destination_city
+        FROM latest_snapshots ls
+        JOIN airlines a ON ls.airline_code = a.iata_code
+        JOIN routes r ON ls.route_id = r.id
+        ORDER BY ls.price ASC
+        LIMIT 1
+    """)
+    row = await cursor.fetchone()
+    if row:
+        stats["cheapest_flight"] = row
+
+    return stats
@@ -13,20 +13,23 @@ import os
 from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 
+import orjson
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 
+# Load environment variables before importing modules that read them at import time
+load_dotenv()
+
 import database as db
+import clients
 from scheduler import start_scheduler, stop_scheduler, fetch_all_prices
+import email_service
 from email_service import send_alert_confirmation, is_configured as email_configured
 
-# Load environment variables
-load_dotenv()
-
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -39,7 +42,7 @@ logger = logging.getLogger(__name__)
 
 
 async def initial_fetch():
-    """Run initial price fetch in the background."""
+    """Run initial price fetch in the background, then start the hourly scheduler."""
     try:
         logger.info("Running initial price fetch in background...")
         result = await fetch_all_prices()
@@ -47,6 +50,9 @@ async def initial_fetch():
     except Exception as e:
         logger.error(f"Initial fetch failed: {e}")
 
+    # Start only once the first fetch is done so the two never overlap
+    start_scheduler()
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -57,16 +63,21 @@ async def lifespan(app: FastAPI):
     await db.init_db()
     logger.info("Database initialized")
 
-    # Run initial price fetch in background (don't block startup)
-    asyncio.create_task(initial_fetch())
-
-    # Start hourly scheduler
-    start_scheduler()
+    # Run initial price fetch in background (don't block startup); it starts the scheduler
+    initial_task = asyncio.create_task(initial_fetch())
 
     yield
 
     # Shutdown
+    initial_task.cancel()
+    try:
+        await initial_task
+    except asyncio.CancelledError:
+        pass
     stop_scheduler()
+    await clients.amadeus_client.aclose()
+    await email_service.aclose()
+    await db.close_db()
     logger.info("Flight Price Monitor stopped")
 
 
@@ -76,6 +87,7 @@ app = FastAPI(
     title="SkyWatch - Flight Price Monitor",
     description="Real-time flight price monitoring for One World alliance airlines",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan,
 )
 
@@ -155,13 +167,22 @@ async def get_price_history(
     airline_code: Optional[str] = None,
     days: int = Query(default=30, ge=1, le=365),
 ):
-    """Get price history for a specific route."""
-    history = await db.get_price_history(
+    """Get price history for a specific route, streamed row by row."""
+    rows = db.iter_price_history(
         route_id=route_id,
         airline_code=airline_code,
         days=days,
     )
-    return {"status": "ok", "data": history}
+
+    async def body():
+        yield b'{"status":"ok","data":['
+        sep = b""
+        async for row in rows:
+            yield sep + orjson.dumps(row)
+            sep = b","
+        yield b"]}"
+
+    return StreamingResponse(body(), media_type="application/json")
 
 
 @app.get("/api/prices/compare/{route_id}")
@@ -171,14 +192,21 @@ async def get_price_comparison(route_id: int):
     return {"status": "ok", "data": comparison}
 
 
+@app.get("/api/prices/route/{route_id}")
+async def get_route_overview(
+    route_id: int,
+    days: int = Query(default=30, ge=1, le=365),
+):
+    """Get price history and airline comparison for a route in one call."""
+    overview = await db.get_route_overview(route_id=route_id, days=days)
+    return {"status": "ok", "data": overview}
+
+
 @app.post("/api/prices/search")
 async def search_flights(request: PriceSearchRequest):
     """Search for live flight prices (triggers API call)."""
-    from amadeus_client import AmadeusClient
-
-    client = AmadeusClient()
     try:
-        results = await client.search_flights(
+        results = await clients.search_flights(
             origin=request.origin,
             destination=request.destination,
             departure_date=request.departure_date,
@@ -199,14 +227,14 @@ async def create_alert(alert: AlertCreate):
         email=alert.email,
         airline_code=alert.airline_code,
     )
+    db.invalidate_cache()
 
     # Send confirmation email
     if email_configured():
         # Look up route details for the email
-        routes = await db.get_routes()
-        route = next((r for r in routes if r["id"] == alert.route_id), None)
+        route = await db.get_route_by_id(alert.route_id)
         if route:
-            send_alert_confirmation(
+            await send_alert_confirmation(
                 to_email=alert.email,
                 origin_city=route["origin_city"],
                 destination_city=route["destination_city"],
@@ -250,4 +278,7 @@ if __name__ == "__main__":
 
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", "8000"))
-    uvicorn.run("main:app", host=host, port=port, reload=True)
+    # Auto-reload only in development; uvicorn picks uvloop/httptools when installed
+    reload = os.getenv("ENV", "prod") == "dev"
+    workers = int(os.getenv("WORKERS", "1"))
+    uvicorn.run("main:app", host=host, port=port, reload=reload, workers=workers)
@@ -3,17 +3,84 @@ Background scheduler for hourly flight price fetching.
 Uses APScheduler to run periodic price checks across all monitored routes.
 """
 
+import asyncio
 import logging
+import os
 from datetime import datetime, timedelta
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from amadeus_client import AmadeusClient
+from clients import amadeus_client
 from email_service import send_price_alert, is_configured as email_configured
 import database as db
 
 logger = logging.getLogger(__name__)
 
 scheduler = AsyncIOScheduler()
-amadeus_client = AmadeusClient()
+
+# Maximum number of Amadeus searches in flight at once
+MAX_CONCURRENCY = int(os.getenv("AMADEUS_MAX_CONCURRENCY", "8"))
+
+# Maximum number of alert emails in flight at once (Resend rate-limits per second)
+EMAIL_MAX_CONCURRENCY = int(os.getenv("EMAIL_MAX_CONC", "16"))
+
+
+async def _fetch_one(
+    route_id: int,
+    origin: str,
+    destination: str,
+    days_ahead: int,
+    departure_date: str,
+    sem: asyncio.Semaphore,
+):
+    """
+    Fetch offers for one route and departure window.
+
+    Returns (snapshot rows, error count) so results can be summed by the caller.
+    """
+    try:
+        # Bypass the search cache: every snapshot saved must be a fresh price
+        async with sem:
+            offers = await amadeus_client.search_flights(
+                origin=origin,
+                destination=destination,
+                departure_date=departure_date,
+                cabin_class="ECONOMY",
+            )
+
+        snapshots = [
+            (
+                route_id,
+                offer["airline_code"],
+                offer["price"],
+                offer.get("currency", "USD"),
+                offer.get("cabin_class", "ECONOMY"),
+                departure_date,
+                None,
+                offer.get("source", "amadeus"),
+            )
+            for offer in offers
+        ]
+        return snapshots, 0
+
+    except Exception as e:
+        logger.error(
+            f"Error fetching prices for {origin}-{destination} "
+            f"(+{days_ahead}d): {e}"
+        )
+        return [], 1
+
+
+async def _send_alert_email(alert: dict, sem: asyncio.Semaphore) -> bool:
+    """Send the notification email for one triggered alert."""
+    async with sem:
+        return await send_price_alert(
+            to_email=alert["email"],
+            origin_city=alert["origin_city"],
+            destination_city=alert["destination_city"],
+            origin_code=alert["origin"],
+            destination_code=alert["destination"],
+            target_price=alert["target_price"],
+            current_price=alert["current_price"],
+        )
 
 
 async def fetch_all_prices():
@@ -21,45 +88,48 @@ async def fetch_all_prices():
     Fetch prices for all monitored routes from all applicable airlines.
     This runs every hour.
     """
-    logger.info(f"Starting scheduled price fetch at {datetime.utcnow().isoformat()}")
+    # One reference time for every window; log records carry their own timestamp
+    now = datetime.utcnow()
+    logger.info("Starting scheduled price fetch")
 
-    routes = await db.get_routes()
-    total_fetched = 0
+    routes = await db.get_route_pairs()
+    snapshots = []
     errors = 0
 
     # Search for flights departing in 7, 14, 30, and 60 days
     search_windows = [7, 14, 30, 60]
-
-    for route in routes:
-        for days_ahead in search_windows:
-            departure_date = (datetime.utcnow() + timedelta(days=days_ahead)).strftime("%Y-%m-%d")
-
-            try:
-                offers = await amadeus_client.search_flights(
-                    origin=route["origin"],
-                    destination=route["destination"],
-                    departure_date=departure_date,
-                    cabin_class="ECONOMY",
-                )
-
-                for offer in offers:
-                    await db.save_price_snapshot(
-                        route_id=route["id"],
-                        airline_code=offer["airline_code"],
-                        price=offer["price"],
-                        currency=offer.get("currency", "USD"),
-                        cabin_class=offer.get("cabin_class", "ECONOMY"),
-                        departure_date=departure_date,
-                        source=offer.get("source", "amadeus"),
-                    )
-                    total_fetched += 1
-
-            except Exception as e:
-                logger.error(
-                    f"Error fetching prices for {route['origin']}-{route['destination']} "
-                    f"(+{days_ahead}d): {e}"
-                )
-                errors += 1
+    dates = [
+        (days_ahead, (now + timedelta(days=days_ahead)).strftime("%Y-%m-%d"))
+        for days_ahead in search_windows
+    ]
+
+    # routes is UNIQUE(origin, destination), so every search here is distinct
+    sem = asyncio.Semaphore(MAX_CONCURRENCY)
+    results = await asyncio.gather(
+        *(
+            _fetch_one(route_id, origin, destination, days_ahead, departure_date, sem)
+            for route_id, origin, destination in routes
+            for days_ahead, departure_date in dates
+        ),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"Unexpected error fetching prices: {result}")
+            errors += 1
+            continue
+        rows, failed = result
+        snapshots.extend(rows)
+        errors += failed
+
+    # Write all snapshots from this run in one transaction
+    total_fetched = 0
+    try:
+        await db.save_price_snapshots_bulk(snapshots)
+        total_fetched = len(snapshots)
+    except Exception as e:
+        logger.error(f"Error saving {len(snapshots)} price snapshots: {e}")
+        errors += 1
 
     # Check alerts after fetching new prices
     try:
@@ -72,26 +142,26 @@ async def fetch_all_prices():
                     f"hit ${alert['current_price']} (target: ${alert['target_price']})"
                 )
 
-                # Send email notification
-                if email_configured():
-                    sent = send_price_alert(
-                        to_email=alert["email"],
-                        origin_city=alert["origin_city"],
-                        destination_city=alert["destination_city"],
-                        origin_code=alert["origin"],
-                        destination_code=alert["destination"],
-                        target_price=alert["target_price"],
-                        current_price=alert["current_price"],
-                    )
-                    if sent:
+            # Send email notifications concurrently
+            if email_configured():
+                sem = asyncio.Semaphore(EMAIL_MAX_CONCURRENCY)
+                results = await asyncio.gather(
+                    *(_send_alert_email(alert, sem) for alert in triggered),
+                    return_exceptions=True,
+                )
+                for alert, sent in zip(triggered, results):
+                    if sent is True:
                         logger.info(f"  Email sent to {alert['email']}")
                     else:
                         logger.warning(f"  Failed to send email to {alert['email']}")
-                else:
-                    logger.info("  Email service not configured — skipping notification")
+            else:
+                logger.info("  Email service not configured — skipping notifications")
     except Exception as e:
         logger.error(f"Error checking alerts: {e}")
 
+    # New prices are in; make the API re-read dashboard data
+    db.invalidate_cache()
+
     logger.info(
         f"Price fetch complete: {total_fetched} prices saved, {errors} errors"
     )
@@ -100,6 +170,10 @@ async def fetch_all_prices():
 
 def start_scheduler():
     """Start the background scheduler with an hourly price fetch job."""
+    if scheduler.running:
+        return
+
+    # First run is one interval from now, i.e. an hour after the initial fetch
     scheduler.add_job(
         fetch_all_prices,
         "interval",
@@ -107,7 +181,10 @@ def start_scheduler():
         id="hourly_price_fetch",
         name="Hourly Flight Price Fetch",
         replace_existing=True,
-        next_run_time=None,  # Don't run immediately; we trigger initial fetch separately
+        # Never overlap runs; collapse missed fires into a single catch-up run
+        max_instances=1,
+        coalesce=True,
+        misfire_grace_time=300,
     )
     scheduler.start()
     logger.info("Background scheduler started - fetching prices every hour")